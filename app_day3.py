@@ -1,8 +1,17 @@
 import streamlit as st
 import os
 from src import day3
+from src.app_cache import file_hash
 from src.visualization import wire_paths
 
+
+@st.cache_resource(show_spinner=False)
+def index_wires(wire_file: str, root_path: str, content_hash: str):
+    """ Crossing index of the wires file, computed once per content """
+    wires = day3.read_wires(wire_file, root_path=root_path)
+    return day3.CrossingIndex(wires, central_port=(0, 0))
+
+
 # Side bar settings
 st.sidebar.markdown('### Settings')
 root_path = st.sidebar.text_input(label='Data folder:', value='data/raw/day3')
@@ -22,8 +31,7 @@ if os.path.exists(root_path):
 
     # Check the wire file
     try:
-        f = open(path, 'r')
-        wires = f.readlines()
+        content_hash = file_hash(path, os.path.getmtime(path))
         st.info('Wire file available.')
 
         # Execution
@@ -31,97 +39,63 @@ if os.path.exists(root_path):
 
             '## Part 1'
 
-            # Format wires lists
-            wires = [w.replace('\n', '') for w in wires]
-            wires = [w.split(',') for w in wires]
-
             try:
-                # Get maximum dimensions
-                dims = [day3.get_panel_dimension(w) for w in wires]
-                dim = 2*max(dims)+1
-                central_port = (max(dims), max(dims))
+                # Index the crossings of all the wires
+                index = index_wires(wire_file, root_path, content_hash)
+                central_port = index.central_port
+                turn_points = index.turn_points()
+
+                # Crossings to keep exact in the simplified paths
+                df = index.crossings()
+                crossings = list(zip(df.x, df.y))
 
                 try:
-                    # Get the wire matrices
-                    full_matrix = None
-                    turn_points = {}
-                    central_port_id = len(wires)+1
-
-                    i = 0
-                    for w in wires:
-                        i = i+1
-                        res = day3.get_wire_path(
-                            w,
-                            size_x=dim, size_y=dim,
+                    # Get closest point
+                    dist_res = index.get_minimum_Manhattan()
+
+                    try:
+                        # Plot wire paths with closest knot
+                        fig = wire_paths.plotly_interactive_paths(
+                            turn_points,
                             central_port=central_port,
-                            central_port_id=central_port_id
+                            knot=dist_res['position'],
+                            width_px=700,
+                            keep_points=crossings
                         )
+                        st.plotly_chart(fig)
 
-                        # Add current wire to the complete matrix
-                        if full_matrix is None:
-                            full_matrix = res['matrix']
-                        else:
-                            full_matrix = full_matrix + res['matrix']
+                        st.markdown(
+                            'Minimum Manhattan distance: {}'.format(dist_res['distance']))
 
-                        # Add current wire to turning points
-                        turn_points.update(
-                            {'Wire '+str(i): res['turn_points']})
-
-                    try:
-                        # Get closest point
-                        dist_res = day3.get_minimum_Manhattan(
-                            full_matrix,
-                            knot_id=len(wires)
-                        )
+                        '## Part 2'
 
                         try:
+                            res_part2 = index.get_minimum_combined_steps()
+
                             # Plot wire paths with closest knot
                             fig = wire_paths.plotly_interactive_paths(
                                 turn_points,
                                 central_port=central_port,
-                                knot=dist_res['position']
+                                knot=res_part2['position'],
+                                width_px=700,
+                                keep_points=crossings
                             )
                             st.plotly_chart(fig)
 
                             st.markdown(
-                                'Minimum Manhattan distance: {}'.format(dist_res['distance']))
-
-                            '## Part 2'
-
-                            try:
-                                res_part2 = day3.get_minimum_combined_steps(
-                                    wires,
-                                    size_x=dim, size_y=dim,
-                                    central_port=central_port,
-                                    matrix=full_matrix,
-                                    knot_id=len(wires)
-                                )
-
-                                # Plot wire paths with closest knot
-                                fig = wire_paths.plotly_interactive_paths(
-                                    turn_points,
-                                    central_port=central_port,
-                                    knot=res_part2['position']
-                                )
-                                st.plotly_chart(fig)
-
-                                st.markdown(
-                                    'Minimum combined steps: {}'.format(res_part2['distance']))
-
-                            except Exception as e:
-                                st.error(
-                                    'Error computing minimum combined steps! {}'.format(e))
+                                'Minimum combined steps: {}'.format(res_part2['distance']))
 
                         except Exception as e:
                             st.error(
-                                'Error while plotting the wire paths! {}'.format(e))
+                                'Error computing minimum combined steps! {}'.format(e))
 
                     except Exception as e:
                         st.error(
-                            'Error computing the Manhattan distance! {}'.format(e))
+                            'Error while plotting the wire paths! {}'.format(e))
 
                 except Exception as e:
-                    st.error('Error creating wire matrices! {}'.format(e))
+                    st.error(
+                        'Error computing the Manhattan distance! {}'.format(e))
 
             except Exception as e:
                 st.error('Error processing the wire paths! {}'.format(e))
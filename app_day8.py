@@ -1,8 +1,35 @@
 import streamlit as st
 import os
 from src import day8
+from src.app_cache import file_hash
 from src.visualization import altair_plots
 
+
+@st.cache_data(show_spinner=False)
+def read_image(digits_file: str, root_path: str,
+               n_rows: int, n_cols: int, content_hash: str):
+    """ Image layers, computed once per content and layer format """
+    return day8.read_image_layers(digits_path=digits_file,
+                                  n_rows=n_rows,
+                                  n_cols=n_cols,
+                                  root_path=root_path)
+
+
+@st.cache_data(show_spinner=False)
+def corruption_code(digits_file: str, root_path: str,
+                    n_rows: int, n_cols: int, content_hash: str) -> int:
+    img = read_image(digits_file, root_path, n_rows, n_cols, content_hash)
+    return day8.check_corrupted_image(img)
+
+
+@st.cache_data(show_spinner=False)
+def decoded_image(digits_file: str, root_path: str,
+                  n_rows: int, n_cols: int, content_hash: str):
+    """ Decoded image as a dataframe to plot it """
+    img = read_image(digits_file, root_path, n_rows, n_cols, content_hash)
+    return day8.image_to_dataframe(day8.decode_image(img))
+
+
 # Side bar settings
 st.sidebar.markdown('### Settings')
 st.sidebar.markdown('#### Image file')
@@ -31,25 +58,22 @@ if os.path.exists(path):
 
         try:
             # Read the image file
-            img = day8.highest_amplification_signal(digits_path=digits_file,
-                                                    n_rows=n_rows,
-                                                    n_cols=n_cols,
-                                                    root_path=root_path)
+            content_hash = file_hash(path, os.path.getmtime(path))
+            img_key = (digits_file, root_path, n_rows, n_cols, content_hash)
+            read_image(*img_key)
 
             '## Part 1'
             st.markdown('Check whether the image is corrupted')
             try:
                 # Get the corruption code
-                code = day8.check_corrupted_image(img)
+                code = corruption_code(*img_key)
                 st.info('Corruption check code: {}'.format(code))
 
                 '## Part 2'
                 st.markdown('Decode the image')
                 try:
-                    decoded = day8.decode_image(img)
-                    
-                    # Transform image to dataframe
-                    df_img = day8.image_to_dataframe(decoded)
+                    # Decoded image as a dataframe
+                    df_img = decoded_image(*img_key)
                     chart = altair_plots.heat_map(df_img)
                     st.altair_chart(chart)
 
@@ -0,0 +1,11 @@
+import hashlib
+import streamlit as st
+
+
+@st.cache_data(show_spinner=False)
+def file_hash(path: str, mtime: float) -> str:
+    """ Hash of the file content, used as key for the cached results
+    of the apps. The file is only read again when its modification
+    time changes """
+    with open(path, 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()
@@ -1,7 +1,9 @@
-from typing import List
-from queue import Queue
+from typing import Iterator, List
+from collections import deque
+from multiprocessing import Pool, shared_memory
 import numpy as np
 import pandas as pd
+import itertools
 import math
 import os
 
@@ -16,10 +18,17 @@ import matplotlib.animation
 
 def read_asteroid_map(map_path: str,
                       root_path: str = 'data/raw',
+                      sparse: bool = False,
+                      dtype: str = 'uint8'
                       ) -> np.ndarray:
     """
     Reads a file containing an asteroids map and returns a zero
-    matrix with ones in asteroid positions.
+    matrix with ones in asteroid positions, indexed as [x, y].
+    The raw bytes are converted directly into the array, with the
+    given dtype.
+
+    If sparse is True, an (n, 2) array with the (x, y) coordinates of
+    the asteroids is returned instead, sorted by x and then y.
     """
 
     # Check the parameters
@@ -27,100 +36,168 @@ def read_asteroid_map(map_path: str,
     if not os.path.exists(path):
         raise ValueError('Map not available at {}'.format(path))
 
-    # Read the program
-    f = open(path, 'r')
-    asteroids = f.read()
-    asteroids = asteroids.split('\n')
+    # Read the raw bytes
+    raw = np.fromfile(path, dtype='uint8')
+    newlines = np.flatnonzero(raw == ord('\n'))
+    width = int(newlines[0]) if len(newlines) > 0 else len(raw)
+    if width > 0 and raw[width-1] == ord('\r'):
+        width -= 1
+    cells = raw[(raw != ord('\n')) & (raw != ord('\r'))]
+
+    if width == 0 or len(cells) % width != 0:
+        raise ValueError('Invalid map format at {}'.format(path))
 
-    # Process the string
-    asteroid_map = []
-    for row in asteroids:
-        if len(row) > 0:
-            asteroid_map.append([(1 if i == '#' else 0) for i in row])
+    if sparse:
+        idx = np.flatnonzero(cells == ord('#'))
+        x, y = idx % width, idx // width
+        order = np.lexsort((y, x))
+        return np.column_stack([x[order], y[order]])
 
-    return(np.array(asteroid_map).transpose())
+    asteroid_map = (cells == ord('#')).reshape(-1, width)
+    return asteroid_map.astype(dtype).transpose()
 
 
-def _find_close(inline: List[tuple],
-                point: tuple
-                ) -> List[tuple]:
+def _reduced_direction(dx: int, dy: int) -> tuple:
     """
-    Find the closest asteroids to the given point in the same line
+    Reduces an offset to its direction with integer coordinates,
+    so all the positions in the same line of sight share it
     """
+    g = math.gcd(dx, dy)
+    return (dx // g, dy // g)
 
-    # Base cases
-    if len(inline) == 0:
-        return([])
-    if len(inline) == 1:
-        return(inline)
-
-    # Divide the two sides of the line
-    if inline[0][0] == point[0]:
-        # Vertical line: up and down sides
-        side1 = [p for p in inline if p[1] > point[1]]
-        side2 = [p for p in inline if p[1] < point[1]]
-    else:
-        # Non vertical line: left and right sides
-        side1 = [p for p in inline if p[0] > point[0]]
-        side2 = [p for p in inline if p[0] < point[0]]
-
-    # Keep closest asteroids
-    closest = []
-    for side in [side1, side2]:
-        if len(side) == 1:
-            closest.extend(side)
-        elif len(side) > 1:
-            # Compute the Euclidean distances
-            ds = [(point[0]-a)**2+(point[1]-b)**2 for a, b in side]
-            closest.append(side[ds.index(min(ds))])
-
-    return closest
-
-
-def _find_inline_asteroids(asteroids_map: np.ndarray,
-                           pos: tuple,
-                           asteroid: tuple,
-                           one_side: bool = False
-                           ) -> List[tuple]:
-
-    x, y = asteroid
-
-    # Posible positions
-    x_positions = list(range(asteroids_map.shape[0]))
-    y_positions = list(range(asteroids_map.shape[1]))
-
-    # Just one side of the line
-    if one_side is True:
-        if pos[0] != x:
-            # Non vertical line
-            if pos[0] > x:
-                x_positions = [
-                    a for a in x_positions if a < pos[0]]  # Pos right
-            else:
-                x_positions = [
-                    a for a in x_positions if a > pos[0]]  # Pos left
-        else:
-            # Vertical line
-            if pos[1] > y:
-                y_positions = [
-                    b for b in y_positions if b < pos[1]]  # Pos down
-            else:
-                y_positions = [b for b in y_positions if b > pos[1]]  # Pos up
-
-    # Compute the positions in the same line
-    def line(pos_x): return y + (pos_x-x)*(pos[1]-y)/(pos[0]-x)
-    if pos[0] != x:
-        values = [(a, int(line(a)))
-                  for a in x_positions if line(a).is_integer()]
-    else:
-        values = [(x, b) for b in y_positions]
 
-    # Remove positions out of the bounds
-    values = [p for p in values if p[1] >=
-              0 and p[1] < asteroids_map.shape[1]]
+def closest_by_direction(asteroids: List[tuple],
+                         pos: tuple
+                         ) -> dict:
+    """
+    Groups the asteroids by their exact direction from the given
+    position, and returns a dictionary with the closest asteroid
+    in each direction.
+    """
+
+    closest = {}
+    for a, b in asteroids:
+        dx, dy = a - pos[0], b - pos[1]
+        if dx == 0 and dy == 0:
+            continue
+
+        # Manhattan distance, to compare asteroids in the same direction
+        direction = _reduced_direction(dx, dy)
+        distance = abs(dx) + abs(dy)
+        if direction not in closest or distance < closest[direction][0]:
+            closest[direction] = (distance, (a, b))
+
+    return {d: ast for d, (_, ast) in closest.items()}
+
+
+def _count_rows(positions: np.ndarray,
+                start: int,
+                end: int,
+                max_elements: int
+                ) -> np.ndarray:
+    """
+    Visible asteroids from the positions start to end-1, counting
+    the different reduced directions to all the other positions.
+    """
+
+    x, y = positions[:, 0], positions[:, 1]
+    n = len(positions)
+
+    # Encoding of the reduced directions as a single integer
+    span_y = 2 * (y.max() - y.min()) + 1
 
-    # Filter to asteroids in those positions
-    return([p for p in values if asteroids_map[p[0], p[1]] > 0])
+    counts = np.empty(end - start, dtype='int64')
+    chunk = max(1, max_elements // n)
+    for i in range(start, end, chunk):
+        j = min(end, i + chunk)
+        dx = x[None, :] - x[i:j, None]
+        dy = y[None, :] - y[i:j, None]
+
+        g = np.gcd(dx, dy)
+        g[g == 0] = 1
+        keys = (dx // g) * span_y + (dy // g)
+
+        # Different directions per row, without the station itself
+        keys.sort(axis=1)
+        counts[i-start:j-start] = (np.diff(keys, axis=1) != 0).sum(axis=1)
+
+    return counts
+
+
+def visible_counts(positions: np.ndarray,
+                   max_elements: int = 2**22
+                   ) -> np.ndarray:
+    """
+    Counts the asteroids visible from each of the provided (n, 2)
+    positions in one batched operation. The offsets to all the other
+    asteroids are reduced with their gcd and encoded as integers, and
+    the different directions of each row are counted after sorting.
+    Rows are processed in chunks of at most max_elements offsets to
+    bound the memory use.
+    """
+
+    positions = np.asarray(positions, dtype='int64')
+    if len(positions) == 0:
+        return np.zeros(0, dtype='int64')
+    return _count_rows(positions, 0, len(positions), max_elements)
+
+
+# Positions shared with the worker processes
+_shared = {}
+
+
+def _init_worker(shm_name: str, shape: tuple, max_elements: int):
+    shm = shared_memory.SharedMemory(name=shm_name)
+    _shared['shm'] = shm
+    _shared['positions'] = np.ndarray(shape, dtype='int64', buffer=shm.buf)
+    _shared['max_elements'] = max_elements
+
+
+def _best_in_rows(rows: tuple) -> tuple:
+    """ Best station among the given range of positions """
+    counts = _count_rows(_shared['positions'], rows[0], rows[1],
+                         _shared['max_elements'])
+    best = int(np.argmax(counts))
+    return (rows[0] + best, int(counts[best]))
+
+
+def best_station(positions: np.ndarray,
+                 processes: int = None,
+                 max_elements: int = 2**22
+                 ) -> tuple:
+    """
+    Finds the position with the maximum number of visible asteroids,
+    splitting the candidate stations across a pool of processes. The
+    positions are shared through shared memory instead of being sent
+    with each task.
+    Returns a tuple with the best position and its count.
+    """
+
+    positions = np.ascontiguousarray(positions, dtype='int64')
+    n = len(positions)
+    if n == 0:
+        raise ValueError('There are no asteroids in the map!')
+
+    processes = processes or os.cpu_count() or 1
+    n_tasks = min(n, 4 * processes)
+    bounds = np.linspace(0, n, n_tasks + 1).astype(int)
+    tasks = [(int(a), int(b)) for a, b in zip(bounds[:-1], bounds[1:])
+             if b > a]
+
+    shm = shared_memory.SharedMemory(create=True, size=positions.nbytes)
+    try:
+        shared = np.ndarray(positions.shape, dtype='int64', buffer=shm.buf)
+        shared[:] = positions
+        with Pool(processes, initializer=_init_worker,
+                  initargs=(shm.name, positions.shape, max_elements)) as pool:
+            results = pool.map(_best_in_rows, tasks)
+    finally:
+        shm.close()
+        shm.unlink()
+
+    # First position with the maximum count, as in the serial version
+    best, count = max(results, key=lambda r: (r[1], -r[0]))
+    return (tuple(int(p) for p in positions[best]), count)
 
 
 def mark_visible_asteroids(asteroids_map: np.ndarray,
@@ -131,28 +208,14 @@ def mark_visible_asteroids(asteroids_map: np.ndarray,
     asteroids from the provided position.
     """
 
-    # Copy map to contain visible asteroids
-    asteroids_map = asteroids_map.copy()
-    asteroids_map[pos[0], pos[1]] = 0
-
-    # Get list of unchecked asteroids
-    unchecked = list(zip(*np.where(asteroids_map == 1)))
-
-    while len(unchecked) > 0:
-        asteroid = unchecked[0]
-
-        # Compute the positions in the same line
-        inline_asteroids = _find_inline_asteroids(asteroids_map,
-                                                  pos, asteroid)
+    asteroids = list(zip(*np.where(asteroids_map == 1)))
+    visible = closest_by_direction(asteroids, pos)
 
-        # Keep just the two closest asteroids
-        closest_asteroids = _find_close(inline_asteroids, pos)
-        for asteroid in inline_asteroids:
-            unchecked.remove(asteroid)
-            if asteroid not in closest_asteroids:
-                asteroids_map[asteroid[0], asteroid[1]] = 0
+    visible_map = np.zeros_like(asteroids_map)
+    for a, b in visible.values():
+        visible_map[a, b] = 1
 
-    return asteroids_map
+    return visible_map
 
 
 def create_plotting_dataframe(asteroids_map: np.ndarray,
@@ -165,6 +228,7 @@ def create_plotting_dataframe(asteroids_map: np.ndarray,
     positions = list(zip(*np.where(visible_asteroids == 1)))
 
     # Create the dataframe
+    positions = set(positions)
     def value_point(p): return 'Visible' if p in positions else (
         'Optimal' if p == optimal_point else 'Non visible')
     values = [value_point(p) for p in asteroids]
@@ -201,29 +265,26 @@ def plot_asteroid_map(asteroids_map: np.ndarray,
                               ).display()
 
 
-def count_optimal_detected(asteroids_map: np.ndarray) -> int:
+def count_optimal_detected(asteroids_map: np.ndarray,
+                           processes: int = None
+                           ) -> int:
     """
     Finds the asteroid from where the maximum number of other asteroids
     are detected. Plots the map marking the visible asteroids along with 
     the optimal position, and returns the number of detected asteroids.
+    With processes, the candidate stations are evaluated in parallel.
     """
 
-    # Variables to store the optimal values
-    max_visible = 0
-    max_position = None
-    visible_asteroids = None
-
     # Find optimal asteroid
-    for x in range(asteroids_map.shape[0]):
-        for y in range(asteroids_map.shape[1]):
-            if asteroids_map[x, y] > 0:
-
-                visible = mark_visible_asteroids(asteroids_map, (x, y))
-
-                if visible.sum() > max_visible:
-                    max_visible = visible.sum()
-                    max_position = (x, y)
-                    visible_asteroids = visible.copy()
+    positions = np.argwhere(asteroids_map > 0)
+    if processes is None:
+        counts = visible_counts(positions)
+        best = int(np.argmax(counts))
+        max_visible = int(counts[best])
+        max_position = tuple(int(p) for p in positions[best])
+    else:
+        max_position, max_visible = best_station(positions, processes)
+    visible_asteroids = mark_visible_asteroids(asteroids_map, max_position)
 
     # Plot the asteroid map
     plot_asteroid_map(asteroids_map, visible_asteroids, max_position)
@@ -236,40 +297,51 @@ def build_angle_structure(asteroids_map: np.ndarray,
                           ) -> dict:
     """
     Creates a dictionary structure to store the asteroids aligned in a 
-    given angle, when comparing with the vertical line from the provided
-    location.
+    given direction from the provided location. The keys are the exact
+    reduced directions (dx, dy), inserted in clockwise order starting
+    from the up vertical, and the values are deques with the asteroids
+    sorted by distance.
     """
 
-    # Get list of unchecked asteroids
-    unchecked = list(zip(*np.where(asteroids_map == 1)))
-    unchecked.remove(location)
+    # Group the asteroids by direction, with their Manhattan distance
+    groups = {}
+    for a, b in zip(*np.where(asteroids_map == 1)):
+        dx, dy = int(a) - location[0], int(b) - location[1]
+        if dx == 0 and dy == 0:
+            continue
+        groups.setdefault(_reduced_direction(dx, dy), []).append(
+            (abs(dx) + abs(dy), (int(a), int(b))))
+
+    # Clockwise angle to the up vertical (y grows downwards)
+    def _angle(direction):
+        return math.atan2(direction[0], -direction[1]) % (2 * math.pi)
+
     angles = {}
+    for direction in sorted(groups, key=_angle):
+        angles[direction] = deque(ast for _, ast in sorted(groups[direction]))
 
-    while len(unchecked) > 0:
-        asteroid = unchecked[0]
+    return angles
 
-        # Find other asteroids in the same direction
-        aligned = _find_inline_asteroids(asteroids_map,
-                                         location, asteroid,
-                                         one_side=True)
 
-        # Sort them by distance
-        ds = [(location[0]-a)**2+(location[1]-b)**2 for a, b in aligned]
-        aligned_sorted = [aligned[ix] for ix in np.argsort(ds)]
+def vaporization_order(asteroids_map: np.ndarray,
+                       location: tuple
+                       ) -> Iterator[tuple]:
+    """
+    Generates the vaporized asteroids in order: the first visible
+    asteroid in each direction when rotating from the up vertical
+    position. The asteroids are produced lazily, one at a time.
+    """
 
-        # Compute the angle to the vertical
-        v = (asteroid[0]-location[0], asteroid[1]-location[1])
-        dot_product = sum((a*b) for a, b in zip(v, (0, -1)))
-        norm = math.sqrt(sum((a*b) for a, b in zip(v, v)))
-        angle = round(math.degrees(math.acos(dot_product / norm)), 2)
-        if asteroid[0] < location[0]:
-            angle = 360 - angle
+    angles = build_angle_structure(asteroids_map, location)
+    rotation = deque(angles.values())
 
-        # Store the asteroids
-        angles[angle] = aligned_sorted
-        [unchecked.remove(ast) for ast in aligned]
+    while rotation:
+        asteroids = rotation.popleft()
+        yield asteroids.popleft()
 
-    return angles
+        # If there are more asteroids, add the direction back
+        if asteroids:
+            rotation.append(asteroids)
 
 
 def vaporize_asteroids(asteroids_map: np.ndarray,
@@ -282,32 +354,8 @@ def vaporize_asteroids(asteroids_map: np.ndarray,
     vertical position.
     Returns a list of the asteroids in order.
     """
-
-    # Final number of asteroids to vaporize
-    total = asteroids_map.sum() - 1
-    if n_asteroids is None or n_asteroids > total:
-        n_asteroids = total
-
-    # Get angles
-    angles = build_angle_structure(asteroids_map, location)
-    rotation_angles = sorted(list(angles.keys()))
-    rotation = Queue()
-    [rotation.put(a) for a in rotation_angles]
-
-    vaporized = []
-    for i in range(n_asteroids):
-        angle = rotation.get()
-        asteroids = angles[angle]
-        vaporized.append(asteroids[0])
-
-        # If there are more asteroids, add the angle back
-        if len(asteroids) > 1:
-            angles[angle] = asteroids[1:]
-            rotation.put(angle)
-        else:
-            angles[angle] = []
-
-    return vaporized
+    order = vaporization_order(asteroids_map, location)
+    return list(itertools.islice(order, n_asteroids))
 
 
 def animated_vaporization(asteroids_map: np.ndarray,
@@ -316,40 +364,48 @@ def animated_vaporization(asteroids_map: np.ndarray,
     """
     Returns an interactive plot highlighting and removing the
     vaporized asteroids in order.
+    The offsets and colors of all the asteroids are computed once,
+    and each frame only updates the asteroids that change.
     """
 
-    asteroids_map = asteroids_map.copy()
+    # Precomputed offsets and colors of all the asteroids
+    positions = np.argwhere(asteroids_map == 1)
+    offsets = np.c_[positions[:, 0], -positions[:, 1]]
+    index = {(int(a), int(b)): i for i, (a, b) in enumerate(positions)}
+    order = np.array([index[tuple(p)] for p in vaporized], dtype=int)
+
+    base_colors = np.tile(matplotlib.colors.to_rgba('k'), (len(positions), 1))
+    base_colors[index[tuple(location)]] = matplotlib.colors.to_rgba('b')
+    fire_color = matplotlib.colors.to_rgba('r')
+    colors = base_colors.copy()
+    state = {'frame': -1}
 
-    # Create empty plot
+    # Create plot
     fig, ax = plt.subplots(figsize=(7, 7))
-    x, y = [], []
     size = 5000/len(asteroids_map)
-    sc = ax.scatter(x, y, s=size)
-    line, = ax.plot(x, y, 'r-', linewidth=2)
+    sc = ax.scatter(offsets[:, 0], offsets[:, 1], s=size, c=colors)
+    line, = ax.plot([], [], 'r-', linewidth=2)
     plt.xlim(-1, asteroids_map.shape[0])
     plt.ylim(-asteroids_map.shape[1], 1)
 
     def animate(i):
+        if i == state['frame'] + 1:
+            # Hide the asteroid vaporized in the previous frame
+            if i > 0:
+                colors[order[i-1], 3] = 0
+        else:
+            # Rebuild the colors when frames are not consecutive
+            colors[:] = base_colors
+            colors[order[:i], 3] = 0
+        state['frame'] = i
+
         # Mark asteroid to vaporize
         asteroid = vaporized[i]
-        fire = np.zeros(asteroids_map.shape)
-        fire[asteroid[0], asteroid[1]] = 1
-
-        # To dataframe
-        df = create_plotting_dataframe(asteroids_map=asteroids_map,
-                                       visible_asteroids=fire,
-                                       optimal_point=location)
-
-        # Update plot values
-        sc.set_offsets(np.c_[df['x'].values, df['y'].values])
-        df['color'] = df['value'].apply(lambda c: 'b' if c=='Optimal' else ('r' if c=='Visible' else 'k'))
-        sc.set_color(df['color'].values)
+        colors[order[i]] = fire_color
+        sc.set_color(colors)
 
         line.set_data([location[0], asteroid[0]], [-location[1], -asteroid[1]])
 
-        # Vaporized asteroid
-        asteroids_map[asteroid[0], asteroid[1]] = 0
-
     ani = matplotlib.animation.FuncAnimation(fig, animate,
                                              frames=len(vaporized), 
                                              interval=200, repeat=False)
@@ -1,10 +1,10 @@
-from typing import List
+from typing import Iterator, List
+from multiprocessing import Pool
 import pandas as pd
 import numpy as np
 
 import matplotlib.pyplot as plt
 import matplotlib.animation
-import matplotlib.cm as cm
 from mpl_toolkits.mplot3d import Axes3D
 
 #################################################################
@@ -44,6 +44,64 @@ def total_energy(positions: pd.DataFrame,
     return sum(pot*kin)
 
 
+#################################################################
+# Vectorized engine: positions and velocities as (n, 3) arrays  #
+#################################################################
+
+def _as_array(positions) -> np.ndarray:
+    """
+    Copy of the positions as an (n, 3) int array. Accepts a DataFrame
+    with columns x, y and z, or any array-like.
+    """
+    if isinstance(positions, pd.DataFrame):
+        positions = positions[['x', 'y', 'z']].values
+    return np.array(positions, dtype='int64')
+
+
+def step(pos: np.ndarray, vel: np.ndarray):
+    """
+    Advances the system one step, updating the arrays in place:
+    applies gravity between every pair of moons, then velocity.
+    The arrays can have leading dimensions to step several systems
+    at once, e.g. (K, n, 3).
+    """
+    vel += np.sign(pos[..., None, :, :] - pos[..., :, None, :]).sum(axis=-2)
+    pos += vel
+
+
+def simulate(positions, steps: int = 10) -> tuple:
+    """
+    Simulates the system for the required number of steps.
+    Returns a tuple with the final positions and velocities.
+    """
+    pos = _as_array(positions)
+    vel = np.zeros_like(pos)
+    for i in range(steps):
+        step(pos, vel)
+    return pos, vel
+
+
+def system_energy(pos: np.ndarray, vel: np.ndarray):
+    """
+    Computes the total energy of the system from the arrays. With
+    leading dimensions, e.g. (K, n, 3), returns the array with the
+    energy of each system.
+    """
+    energy = (np.abs(pos).sum(axis=-1) * np.abs(vel).sum(axis=-1)).sum(axis=-1)
+    return int(energy) if energy.ndim == 0 else energy
+
+
+def batch_system_energy(positions: np.ndarray,
+                        steps: int = 10
+                        ) -> np.ndarray:
+    """
+    Simulates a stack of K systems, given as a (K, n, 3) array of
+    initial positions, and returns the (K,) total energies after the
+    required number of steps
+    """
+    return system_energy(*simulate(positions, steps))
+
+
 def compute_system_energy(positions: pd.DataFrame,
                           steps: int = 10
                           ) -> int:
@@ -51,72 +109,101 @@ def compute_system_energy(positions: pd.DataFrame,
     Computes the total energy of the system after the required
     number of steps
     """
+    return system_energy(*simulate(positions, steps))
 
-    velocities = pd.DataFrame({'x': [0]*len(positions),
-                               'y': [0]*len(positions),
-                               'z': [0]*len(positions)})
 
-    for i in range(steps):
+def trajectory(positions,
+               steps: int = 10,
+               stride: int = 1
+               ) -> Iterator[np.ndarray]:
+    """
+    Generates the (n, 3) positions of the moons every stride steps,
+    until the required number of steps. The same array is updated
+    and yielded each time, so it has to be copied to be kept.
+    """
+    pos = _as_array(positions)
+    vel = np.zeros_like(pos)
+    for i in range(1, steps+1):
+        step(pos, vel)
+        if i % stride == 0:
+            yield pos
+
+
+def record_trajectory(positions,
+                      steps: int = 10,
+                      stride: int = 1,
+                      path: str = None
+                      ) -> tuple:
+    """
+    Stores the positions every stride steps into a preallocated
+    (frames, n, 3) array, or into a memory-mapped .npy file if a path
+    is provided. The limits of each axis are tracked while filling it.
 
-        # Apply gravity
-        velocities = update_velocity(positions, velocities)
+    Return:
+    A tuple with the array of positions and the (min, max) limits,
+    each one as an array with a value per axis
+    """
 
-        # Apply velocity
-        positions = positions + velocities
+    if stride < 1:
+        raise ValueError('The stride must be at least 1!')
+    if steps < 0:
+        raise ValueError('The number of steps can not be negative!')
+
+    n = len(_as_array(positions))
+    frames = steps // stride
+    if path is None:
+        traj = np.empty((frames, n, 3), dtype='int64')
+    else:
+        traj = np.lib.format.open_memmap(path, mode='w+', dtype='int64',
+                                         shape=(frames, n, 3))
 
-    return total_energy(positions, velocities)
+    lower = np.full(3, np.iinfo('int64').max)
+    upper = np.full(3, np.iinfo('int64').min)
+    for i, pos in enumerate(trajectory(positions, steps, stride)):
+        traj[i] = pos
+        np.minimum(lower, pos.min(axis=0), out=lower)
+        np.maximum(upper, pos.max(axis=0), out=upper)
+
+    if path is not None:
+        traj.flush()
+    return traj, (lower, upper)
 
 
 def animate_system(positions: pd.DataFrame,
                    steps: int = 10,
-                   size: int = 100
+                   size: int = 100,
+                   stride: int = 1,
+                   path: str = None
                    ) -> int:
     """
     Creates an interactive plot to visualize the positions of the
-    moons at each step
+    moons every stride steps. With a path, the positions are kept
+    in a memory-mapped file instead of in memory.
     """
 
-    velocities = pd.DataFrame({'x': [0]*len(positions),
-                               'y': [0]*len(positions),
-                               'z': [0]*len(positions)})
+    # Compute all positions
+    step_pos, (lower, upper) = record_trajectory(positions, steps,
+                                                 stride, path)
 
     # Create empty plot
     fig = plt.figure(figsize=(7, 7))
     ax = fig.add_subplot(111, projection='3d')
     x, y, z = [], [], []
-    colors = cm.copper(4)
     sc = ax.scatter(x, y, z, s=size)
 
-    # Compute all positions
-    step_pos = []
-
-    for i in range(steps):
-
-        # Apply gravity
-        velocities = update_velocity(positions, velocities)
-
-        # Apply velocity
-        positions = positions + velocities
-
-        step_pos.append(positions)
-
     # Set plot limits
-    allx = [i for sl in [list(p['x']) for p in step_pos] for i in sl]
-    ally = [i for sl in [list(p['y']) for p in step_pos] for i in sl]
-    allz = [i for sl in [list(p['z']) for p in step_pos] for i in sl]
-    ax.set_xlim3d(min(allx), max(allx))
-    ax.set_ylim3d(min(ally), max(ally))
-    ax.set_zlim3d(min(allz), max(allz))
+    if len(step_pos) > 0:
+        ax.set_xlim3d(lower[0], upper[0])
+        ax.set_ylim3d(lower[1], upper[1])
+        ax.set_zlim3d(lower[2], upper[2])
 
     # Animation
     def animate(i):
         pos = step_pos[i]
-        sc._offsets3d = (pos['x'].values,
-                         pos['y'].values,
-                         pos['z'].values)
+        sc._offsets3d = (pos[:, 0], pos[:, 1], pos[:, 2])
 
     ani = matplotlib.animation.FuncAnimation(fig, animate,
-                                             frames=steps,
+                                             frames=len(step_pos),
                                              interval=200,
                                              repeat=False)
     return ani
@@ -138,46 +225,130 @@ def animate_system(positions: pd.DataFrame,
 ################################################################
 
 
-def cicle_length(positions: pd.DataFrame) -> int:
+# Above this number of moons, the axis is simulated with NumPy arrays
+NUMPY_MOONS = 16
+
+
+def _axis_cicle_loop(start: List[int]) -> int:
     """
-    Computes the number of steps until the first state repetition
+    Cicle length of one axis, with a tight loop over Python ints
+    (faster than NumPy for a few moons)
     """
+    pos = list(start)
+    vel = [0] * len(pos)
+    moons = range(len(pos))
+    steps = 0
 
-    # Initialize velocities
-    velocities = pd.DataFrame({'x': [0]*len(positions),
-                               'y': [0]*len(positions),
-                               'z': [0]*len(positions)})
+    while True:
+        steps += 1
 
-    # Store first state
-    first_pos = positions.copy()
-    first_vel = velocities.copy()
+        # Apply gravity
+        for i in moons:
+            p_i = pos[i]
+            g = 0
+            for p_j in pos:
+                if p_j > p_i:
+                    g += 1
+                elif p_j < p_i:
+                    g -= 1
+            vel[i] += g
 
-    # Loop over each dimension
-    cicles = []
-    for dim in velocities.keys():
-        print(f'Dimension: {dim}')
+        # Apply velocity
+        for i in moons:
+            pos[i] += vel[i]
 
-        # Initialize 
-        steps = 0
-        reached_initial = False
-        pos = first_pos[dim].values
-        vel = first_vel[dim].values
+        if pos == start and not any(vel):
+            return steps
 
-        while not reached_initial:
-            steps += 1
 
-            if steps % 1000 == 0:
-                print(steps)
+def _axis_cicle_numpy(start: List[int]) -> int:
+    """
+    Cicle length of one axis, with preallocated NumPy arrays
+    """
+    first = np.array(start, dtype='int64')
+    pos = first.copy()
+    vel = np.zeros_like(pos)
+    diff = np.empty((len(pos), len(pos)), dtype='int64')
+    gravity = np.empty_like(pos)
+    steps = 0
 
-            # Apply gravity
-            vel_change = [sum([(1 if x<y else -1) for y in [p for p in pos if p!=x]]) for x in pos]
-            vel = vel + vel_change
+    while True:
+        steps += 1
 
-            # Apply velocity
-            pos = pos + vel
+        # Apply gravity
+        np.subtract(pos[None, :], pos[:, None], out=diff)
+        np.sign(diff, out=diff)
+        diff.sum(axis=1, out=gravity)
+        vel += gravity
 
-            if all(first_pos[dim].values == pos) & all(first_vel[dim].values == vel):
-                cicles.append(steps)
-                reached_initial = True
+        # Apply velocity
+        pos += vel
+
+        if not vel.any() and np.array_equal(pos, first):
+            return steps
+
+
+def axis_cicle_length(start: List[int]) -> int:
+    """
+    Computes the number of steps until the first repetition of the
+    state of a single axis, starting with zero velocities
+    """
+    start = [int(p) for p in start]
+    if len(start) > NUMPY_MOONS:
+        return _axis_cicle_numpy(start)
+    return _axis_cicle_loop(start)
+
+
+def cicle_length(positions: pd.DataFrame, processes: int = 3) -> int:
+    """
+    Computes the number of steps until the first state repetition.
+    The three axes are simulated independently, in a pool of
+    processes unless processes is 1.
+    """
+
+    axes = [list(axis) for axis in _as_array(positions).T]
+
+    if processes == 1:
+        cicles = [axis_cicle_length(axis) for axis in axes]
+    else:
+        with Pool(processes) as pool:
+            cicles = pool.map(axis_cicle_length, axes)
+
+    return int(np.lcm.reduce(np.array(cicles, dtype='int64')))
+
+
+def batch_cicle_lengths(positions: np.ndarray) -> np.ndarray:
+    """
+    Computes the per-axis cicle lengths of a stack of K systems, given
+    as a (K, n, 3) array of initial positions. All the axes of all the
+    systems are simulated together until each one returns to its
+    initial state.
+    Returns a (K, 3) array; the cicle of each system is the lcm of
+    its row (which may not fit in 64 bits).
+    """
 
-    return np.lcm.reduce(cicles)
+    positions = np.array(positions, dtype='int64')
+    k, n, dims = positions.shape
+
+    # One independent 1-D system per (system, axis)
+    first = positions.transpose(0, 2, 1).reshape(-1, n, 1)
+    pos = first.copy()
+    vel = np.zeros_like(pos)
+    cicles = np.zeros(len(first), dtype='int64')
+    active = np.arange(len(first))
+    steps = 0
+
+    while len(active) > 0:
+        steps += 1
+        step(pos, vel)
+
+        # Axes back in the initial state
+        done = (~vel.any(axis=(1, 2)) &
+                (pos == first[active]).all(axis=(1, 2)))
+        if done.any():
+            cicles[active[done]] = steps
+            active = active[~done]
+            pos = pos[~done]
+            vel = vel[~done]
+
+    return cicles.reshape(k, dims)
@@ -1,113 +1,300 @@
-import networkx as nx
 from typing import List
-import math
+import numpy as np
+import re
+
+# Each term of a reaction: quantity and chemical
+_TERM = re.compile(r'(\d+) (\w+)')
+
 
 def parse_reaction(reaction: str) -> dict:
-    """ We can't use a regular expression because each reaction
-    has a different number of components"""
-    inputs = reaction.split(' => ')[0]
-    output = reaction.split(' => ')[1]
-    reaction = {'out': (output.split(' ')[1], int(output.split(' ')[0]))}
-    input_list = []
-    for inp in inputs.split(', '):
-        input_list.append((inp.split(' ')[1], int(inp.split(' ')[0])))
-    reaction['in'] = input_list
-    return reaction
-
-
-def construct_tree(reactions: List[str]):
-    """ Cronstructs a directed graph to represent the provided
-    reactions """
-    reactions = [parse_reaction(r) for r in reactions]
-    G = nx.DiGraph()
+    """ Parses a reaction like '7 A, 1 E => 1 FUEL': one or more
+    inputs and exactly one output """
+    sides = reaction.split('=>')
+    if len(sides) != 2:
+        raise ValueError('Invalid reaction: {}'.format(reaction))
+
+    inputs, output = [[_TERM.fullmatch(t.strip()) for t in side.split(',')]
+                      for side in sides]
+    if len(output) != 1 or not all(inputs + output):
+        raise ValueError('Invalid reaction: {}'.format(reaction))
+
+    def _term(m):
+        return (m.group(2), int(m.group(1)))
+    return {'out': _term(output[0]), 'in': [_term(m) for m in inputs]}
+
+
+class ReactionGraph(object):
+    """
+    Directed graph of reactions, stored in dictionaries:
+    - produced: units produced by the reaction of each chemical
+    - inputs: list of (input, quantity) for each produced chemical
+    - outputs: chemicals that use each chemical as input
+    """
+
+    def __init__(self):
+        self.produced = {}
+        self.inputs = {}
+        self.outputs = {}
+
+    def add_reaction(self, output: str, n: int, inputs: List[tuple]):
+        self.produced[output] = n
+        self.inputs[output] = list(inputs)
+        self.outputs.setdefault(output, [])
+        for chemical, _ in inputs:
+            self.outputs.setdefault(chemical, []).append(output)
+
+    @property
+    def nodes(self) -> List[str]:
+        return list(self.outputs.keys())
 
-    # Add nodes
-    chemicals = [r['out'] for r in reactions]
-    for c in chemicals:
-        G.add_node(c[0], n=c[1], left=0)
+    def in_degree(self, chemical: str) -> int:
+        return len(self.inputs.get(chemical, []))
 
-    # Add edges
-    for reaction in reactions:
-        out = reaction['out'][0]
-        edges = [(e[0], out, e[1]) for e in reaction['in']]
-        G.add_weighted_edges_from(edges)
+    def to_networkx(self):
+        """ Exports the reactions as a networkx DiGraph, with the
+        produced units as node attribute 'n' and the quantities as
+        edge weights (networkx is only needed here) """
+        import networkx as nx
 
+        G = nx.DiGraph()
+        for c, n in self.produced.items():
+            G.add_node(c, n=n, left=0)
+        for out, inputs in self.inputs.items():
+            G.add_weighted_edges_from([(c, out, q) for c, q in inputs])
+        return G
+
+
+def construct_tree(reactions: List[str]) -> ReactionGraph:
+    """ Cronstructs a directed graph to represent the provided
+    reactions """
+    G = ReactionGraph()
+    for r in reactions:
+        reaction = parse_reaction(r)
+        G.add_reaction(*reaction['out'], reaction['in'])
     return G
 
 
-def DFS_ORE(graph): 
-    """ Depth First Search algorithm to count the number of
-    required ORE to produce 1 unit of FUEL.
-    It accounts for the left overs in each reaction.
+class CompiledReactions(object):
+    """
+    Reactions compiled into integer-indexed arrays, with the chemicals
+    in topological order (every chemical after all its inputs):
+    - produced: units produced by the reaction of each chemical
+      (0 for the raw chemicals, like ORE)
+    - in_ptr: the inputs of chemical i are in_idx[in_ptr[i]:in_ptr[i+1]]
+    - in_idx, in_qty: index and quantity of each input
     """
-    G = graph.copy()
-    def _DFSUtil(v, n: int): 
-        if v == 'ORE':
-            return n
-        
-        # How many v's I need using the leftovers
-        needed = n - G.nodes[v]['left']
-
-        # Remove the v's used from the leftovers
-        G.nodes[v]['left'] = max(0, G.nodes[v]['left'] - n)
-
-        # Produce the needed ones
-        total = 0
-        if needed > 0:
+
+    def __init__(self, graph):
+
+        # Topological sort (Kahn), inputs before outputs
+        pending = {v: graph.in_degree(v) for v in graph.nodes}
+        ready = [v for v, d in pending.items() if d == 0]
+        order = []
+        while ready:
+            v = ready.pop()
+            order.append(v)
+            for w in graph.outputs[v]:
+                pending[w] -= 1
+                if pending[w] == 0:
+                    ready.append(w)
+        if len(order) != len(pending):
+            raise ValueError('The reactions contain a cycle!')
+
+        self.chemicals = order
+        self.index = {c: i for i, c in enumerate(order)}
+
+        produced, in_ptr, in_idx, in_qty = [], [0], [], []
+        for c in order:
+            produced.append(graph.produced.get(c, 0))
+            for i, q in graph.inputs.get(c, []):
+                in_idx.append(self.index[i])
+                in_qty.append(q)
+            in_ptr.append(len(in_idx))
+
+        self.produced = np.array(produced, dtype='int64')
+        self.in_ptr = np.array(in_ptr, dtype='int64')
+        self.in_idx = np.array(in_idx, dtype='int64')
+        self.in_qty = np.array(in_qty, dtype='int64')
+        self._ore_cache = {}
+
+        # Demand vectors kept for incremental updates: the pinned FUEL
+        # amounts plus the last one queried
+        self._pinned = {1}
+        self._last = None
+        self._demand_cache = {}
+
+    def _react(self, demand: np.ndarray, chemicals):
+        """
+        Adds to the demand the inputs consumed by the reactions of
+        the given chemicals, following their order
+        """
+        for c in chemicals:
+            if self.produced[c] == 0 or demand[c] == 0:
+                continue
+
             # How many times the reaction has to be executed
-            n_react = math.ceil(needed/G.nodes[v]['n'])
+            n_react = -(-demand[c] // self.produced[c])
+            start, end = self.in_ptr[c], self.in_ptr[c+1]
+            demand[self.in_idx[start:end]] += n_react * self.in_qty[start:end]
+
+    def demand(self, n_fuel: int = 1, target: str = 'FUEL') -> np.ndarray:
+        """
+        Total units of each chemical consumed to produce n_fuel units
+        of the target, in a single reverse topological pass: each
+        chemical is processed once, after all its consumers.
+        The demands of the pinned FUEL amounts and of the last FUEL
+        query are cached to allow incremental updates.
+        """
+        if target == 'FUEL' and n_fuel in self._demand_cache:
+            self._set_last(n_fuel)
+            return self._demand_cache[n_fuel].copy()
+
+        demand = np.zeros(len(self.chemicals), dtype='int64')
+        demand[self.index[target]] = n_fuel
+        self._react(demand, range(len(self.chemicals) - 1, -1, -1))
+
+        if target == 'FUEL':
+            self._demand_cache[n_fuel] = demand.copy()
+            self._set_last(n_fuel)
+        return demand
+
+    def _set_last(self, n_fuel: int):
+        """ Replaces the last FUEL query, dropping the demand of the
+        previous one unless it is pinned """
+        if self._last not in (None, n_fuel) and self._last not in self._pinned:
+            self._demand_cache.pop(self._last, None)
+        self._last = n_fuel
+
+    def pin(self, n_fuel: int):
+        """ Keeps the demand of n_fuel units of FUEL up to date
+        across reaction updates (n_fuel=1 is pinned by default) """
+        self._pinned.add(n_fuel)
+        self.demand(n_fuel)
+
+    def unpin(self, n_fuel: int):
+        self._pinned.discard(n_fuel)
+        if n_fuel != self._last:
+            self._demand_cache.pop(n_fuel, None)
+
+    def ore_required(self, n_fuel: int = 1) -> int:
+        """ Units of ORE required to produce n_fuel units of FUEL.
+        It is a pure function of n_fuel, so the results are cached """
+        if n_fuel not in self._ore_cache:
+            ore = self.demand(n_fuel)[self.index['ORE']]
+            self._ore_cache[n_fuel] = int(ore)
+        return self._ore_cache[n_fuel]
+
+    def _upstream(self, chemical: int) -> List[int]:
+        """ The chemical and all its direct or indirect inputs,
+        in reverse topological order """
+        seen = {chemical}
+        stack = [chemical]
+        while stack:
+            c = stack.pop()
+            for i in self.in_idx[self.in_ptr[c]:self.in_ptr[c+1]].tolist():
+                if i not in seen:
+                    seen.add(i)
+                    stack.append(i)
+        return sorted(seen, reverse=True)
+
+    def update_reaction(self,
+                        chemical: str,
+                        n: int = None,
+                        inputs: dict = None):
+        """
+        Changes the quantities of the reaction producing the chemical:
+        the produced units n, and/or the quantity of some of its inputs,
+        given as a dictionary {input: quantity}. The inputs themselves
+        can't change, so the topological order is kept.
+
+        The cached demands (pinned and last query) are updated
+        re-solving only the chemical and its inputs: the demands from
+        the rest of the reactions don't change. The other cached ORE
+        values are dropped.
+        """
 
-            for i in G.predecessors(v): 
-                needed_i = n_react*G[i][v]['weight']
-                total += _DFSUtil(i, needed_i)
-            G.nodes[v]['left'] += n_react*G.nodes[v]['n'] - needed
-        return total
-    
-    return _DFSUtil('FUEL', 1) 
+        c = self.index[chemical]
+        if self.produced[c] == 0:
+            raise ValueError('{} is not produced by any reaction'.format(
+                chemical))
+        if n is not None and n <= 0:
+            raise ValueError('The produced units must be positive!')
 
+        # Positions of the inputs to change
+        start, end = self.in_ptr[c], self.in_ptr[c+1]
+        positions = {self.chemicals[i]: start + k
+                     for k, i in enumerate(self.in_idx[start:end].tolist())}
+        changes = {}
+        for inp, q in (inputs or {}).items():
+            if inp not in positions:
+                raise ValueError('{} is not an input of {}'.format(
+                    inp, chemical))
+            if q < 0:
+                raise ValueError(
+                    'The quantity of {} can not be negative!'.format(inp))
+            changes[positions[inp]] = q
 
-def DFS_n_fuel(graph, ore: int): 
-    """ Depth First Search algorithm to count the number of
-    FUEL units that could be created with 'ore' units of ORE.
+        # Remove the reactions with the old quantities, computing first
+        # the executions from the current demands. Only the demands
+        # from the unaffected consumers remain
+        affected = self._upstream(c)
+        for demand in self._demand_cache.values():
+            n_react = [(k, -(-demand[k] // self.produced[k]))
+                       for k in affected if self.produced[k] > 0]
+            for k, times in n_react:
+                s, e = self.in_ptr[k], self.in_ptr[k+1]
+                demand[self.in_idx[s:e]] -= times * self.in_qty[s:e]
+
+        # Apply the changes
+        if n is not None:
+            self.produced[c] = n
+        for position, q in changes.items():
+            self.in_qty[position] = q
+
+        # Re-solve the affected chemicals with the new quantities
+        for demand in self._demand_cache.values():
+            self._react(demand, affected)
+        self._ore_cache = {}
+
+    def max_fuel(self, ore: int) -> int:
+        """
+        Maximum units of FUEL that can be produced with the given ORE.
+        The ORE required grows with the FUEL, so an exponential search
+        finds an upper bound and a binary search the exact value.
+        """
+        if self.ore_required(1) > ore:
+            return 0
+
+        # Upper bound: first power of 2 that is not affordable
+        upper = 2
+        while self.ore_required(upper) <= ore:
+            upper *= 2
+        lower = upper // 2
+
+        # Invariant: lower is affordable, upper is not
+        while upper - lower > 1:
+            middle = (lower + upper) // 2
+            if self.ore_required(middle) <= ore:
+                lower = middle
+            else:
+                upper = middle
+
+        return lower
+
+
+def DFS_ORE(graph):
+    """ Counts the number of required ORE to produce 1 unit of FUEL.
     It accounts for the left overs in each reaction.
+    Despite the name, it no longer uses a DFS: the reactions are
+    compiled and solved in reverse topological order.
     """
-    G = graph.copy()
-    def _DFSUtil(v, n: int): 
-        if v == 'ORE':
-            return n
-        
-        # How many v's I need using the leftovers
-        needed = n - G.nodes[v]['left']
-
-        # Remove the v's used from the leftovers
-        G.nodes[v]['left'] = max(0, G.nodes[v]['left'] - n)
-
-        # Produce the needed ones
-        total = 0
-        if needed > 0:
-            # How many times the reaction has to be executed
-            n_react = math.ceil(needed/G.nodes[v]['n'])
-
-            for i in G.predecessors(v): 
-                needed_i = n_react*G[i][v]['weight']
-                total += _DFSUtil(i, needed_i)
-            G.nodes[v]['left'] += n_react*G.nodes[v]['n'] - needed
-        return total
-    
-    # ORE required to compute 1 fuel
-    min_ore = _DFSUtil('FUEL', 1)
-
-    # Initialize the loop variables (1 fuel created)
-    n_fuel = 1
-    used_ore = min_ore
-    fuel_iter = 1
-
-    while fuel_iter>0:
-        # Minimum number of fuels that could be created
-        # in this iteration without using the leftovers
-        fuel_iter = math.floor((ore-used_ore)/min_ore)
-        used_ore += _DFSUtil('FUEL', fuel_iter)
-        if ore > used_ore:
-            n_fuel += fuel_iter
-
-    return n_fuel
+    return CompiledReactions(graph).ore_required(1)
+
+
+def DFS_n_fuel(graph, ore: int):
+    """ Counts the number of FUEL units that could be created with
+    'ore' units of ORE. It accounts for the left overs in each reaction.
+    Despite the name, it no longer uses a DFS: it searches the maximum
+    FUEL whose ORE requirement fits in the budget.
+    """
+    return CompiledReactions(graph).max_fuel(ore)
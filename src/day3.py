@@ -1,25 +1,114 @@
-from typing import List
+from typing import List, Union
+import os
+import numpy as np
 import pandas as pd
 from scipy import sparse as sp
 import streamlit as st
 
 
-def get_panel_dimension(path: List[str]) -> int:
+# Unit (dx, dy) movement for each direction byte
+_MOVES = np.zeros((256, 2), dtype='int64')
+_MOVES[ord('U')] = (0, 1)
+_MOVES[ord('D')] = (0, -1)
+_MOVES[ord('R')] = (1, 0)
+_MOVES[ord('L')] = (-1, 0)
+_POWERS = 10 ** np.arange(19, dtype='int64')
+
+
+def parse_wire(wire: Union[str, bytes, List[str]]) -> np.ndarray:
+    """
+    Parses a wire path like 'R75,D30,U83' into an (n, 3) int array
+    with columns dx, dy and length. The whole path is converted at
+    once with array operations over its bytes.
+    """
+
+    if isinstance(wire, list):
+        wire = ','.join(wire)
+    if isinstance(wire, str):
+        wire = wire.encode()
+    raw = np.frombuffer(wire.strip() + b',', dtype='uint8')
+
+    # Token boundaries: each token is a letter followed by digits
+    is_comma = raw == ord(',')
+    commas = np.flatnonzero(is_comma)
+    starts = np.r_[0, commas[:-1] + 1]
+    letters = raw[starts]
+    is_digit = (raw >= ord('0')) & (raw <= ord('9'))
+
+    n_letters = np.count_nonzero(~is_digit & ~is_comma)
+    if (n_letters != len(starts) or
+            not np.all(_MOVES[letters].any(axis=1)) or
+            np.any(commas - starts < 2) or
+            np.any(commas - starts > len(_POWERS))):
+        raise ValueError('Invalid path!')
+
+    # Decimal value of each token from its digits
+    idx = np.flatnonzero(is_digit)
+    token = np.cumsum(is_comma)[idx]
+    exponent = commas[token] - idx - 1
+    values = np.zeros(len(raw), dtype='int64')
+    values[idx] = (raw[idx] - ord('0')) * _POWERS[exponent]
+    lengths = np.add.reduceat(values, starts)
+
+    return np.column_stack([_MOVES[letters], lengths])
+
+
+def read_wires(wires_path: str,
+               root_path: str = 'data/raw'
+               ) -> List[np.ndarray]:
+    """
+    Reads a file with one wire path per line and returns a list
+    with the parsed (dx, dy, length) array of each wire.
+    """
+
+    # Check the parameters
+    path = os.path.join(root_path, wires_path)
+    if not os.path.exists(path):
+        raise ValueError('Wires not available at {}'.format(path))
+
+    with open(path, 'rb') as f:
+        lines = f.read().split(b'\n')
+    return [parse_wire(line) for line in lines if len(line.strip()) > 0]
+
+
+def wire_vertices(moves: np.ndarray,
+                  central_port: tuple = (0, 0)
+                  ) -> np.ndarray:
+    """
+    Returns an (n+1, 2) array with the central port followed by the
+    ending point of each move of the wire.
+    """
+    offsets = moves[:, :2] * moves[:, 2:3]
+    vertices = np.zeros((len(moves)+1, 2), dtype='int64')
+    vertices[0] = central_port
+    np.cumsum(offsets, axis=0, out=vertices[1:])
+    vertices[1:] += vertices[0]
+    return vertices
+
+
+def wire_bounding_box(moves: np.ndarray,
+                      central_port: tuple = (0, 0)
+                      ) -> tuple:
+    """
+    Returns the ((min_x, min_y), (max_x, max_y)) corners of the
+    area covered by the wire.
+    """
+    vertices = wire_vertices(moves, central_port)
+    return (tuple(vertices.min(axis=0).tolist()),
+            tuple(vertices.max(axis=0).tolist()))
+
+
+def get_panel_dimension(path: Union[List[str], np.ndarray]) -> int:
     """
     Gets the maximum number of steps the wire takes in any
     of the four directions.
     """
 
-    def _sum_steps(direction) -> int:
-        steps = [int(s[1:]) for s in path if s[0] == direction]
-        return sum(steps)
-
-    right = _sum_steps('R')
-    left = _sum_steps('L')
-    up = _sum_steps('U')
-    down = _sum_steps('D')
+    moves = path if isinstance(path, np.ndarray) else parse_wire(path)
+    steps = [moves[(moves[:, 0] == dx) & (moves[:, 1] == dy), 2].sum()
+             for dx, dy in [(1, 0), (-1, 0), (0, 1), (0, -1)]]
 
-    return max(right, left, up, down)
+    return int(max(steps))
 
 
 def check_point_in_interval(start: tuple,
@@ -93,23 +182,10 @@ def get_wire_path(path: List[str],
                                 'y': [central_port[1]]})
 
     # Write 1's in the path
+    moves = path if isinstance(path, np.ndarray) else parse_wire(path)
+    vertices = wire_vertices(moves, central_port).tolist()
     start = central_port
-    for step in path:
-        direction = step[0]
-        n = int(step[1:])
-
-        # Find the ending point
-        if direction == 'U':
-            end = (start[0], start[1] + n)
-        elif direction == 'D':
-            end = (start[0], start[1] - n)
-        elif direction == 'R':
-            end = (start[0] + n, start[1])
-        elif direction == 'L':
-            end = (start[0] - n, start[1])
-        else:
-            raise ValueError('Invalid path!')
-
+    for end in vertices[1:]:
         # Check if a mark_point is in the path
         point = check_point_in_interval(start, end, mark_points)
         if point is not None:
@@ -245,4 +321,212 @@ def get_minimum_combined_steps(paths: List[List[str]],
     knot = (df_wires.loc[idx]['x'], df_wires.loc[idx]['y'])
     dis = int(df_wires.loc[idx]['combined'])
 
-    return {'position': knot, 'distance': dis}
\ No newline at end of file
+    return {'position': knot, 'distance': dis}
+
+#################################################################
+# N-way crossing index                                          #
+# Works on the wire segments instead of a matrix with the full  #
+# panel, so the cost scales with the number of segments         #
+#################################################################
+
+def get_wire_segments(path: Union[List[str], np.ndarray],
+                      central_port: tuple = (0, 0)
+                      ) -> List[tuple]:
+    """
+    Converts a wire path into a list of axis aligned segments.
+    Each segment is a tuple (x0, y0, x1, y1, steps), where steps
+    is the number of steps walked before reaching (x0, y0).
+    """
+
+    moves = path if isinstance(path, np.ndarray) else parse_wire(path)
+    vertices = wire_vertices(moves, central_port)
+    steps = np.r_[0, np.cumsum(moves[:, 2])[:-1]]
+
+    segments = np.column_stack([vertices[:-1], vertices[1:], steps])
+    return [tuple(s) for s in segments.tolist()]
+
+
+def _segment_intersection(seg1: tuple,
+                          seg2: tuple,
+                          bounds: tuple = None
+                          ) -> List[tuple]:
+    """
+    Returns the list of points shared by two axis aligned segments.
+    Collinear segments can share more than one point. With bounds
+    (x_min, y_min, x_max, y_max), only the points inside them are
+    returned.
+    """
+
+    x_lower = max(min(seg1[0], seg1[2]), min(seg2[0], seg2[2]))
+    x_upper = min(max(seg1[0], seg1[2]), max(seg2[0], seg2[2]))
+    y_lower = max(min(seg1[1], seg1[3]), min(seg2[1], seg2[3]))
+    y_upper = min(max(seg1[1], seg1[3]), max(seg2[1], seg2[3]))
+
+    if bounds is not None:
+        x_lower, y_lower = max(x_lower, bounds[0]), max(y_lower, bounds[1])
+        x_upper, y_upper = min(x_upper, bounds[2]), min(y_upper, bounds[3])
+
+    if x_lower > x_upper or y_lower > y_upper:
+        return []
+
+    # At least one of the ranges is a single value
+    return [(x, y)
+            for x in range(x_lower, x_upper+1)
+            for y in range(y_lower, y_upper+1)]
+
+
+class CrossingIndex(object):
+    """
+    Spatial hash over the segments of any number of wires. Each
+    segment is stored in the buckets of the grid cells it goes
+    through, so only segments sharing a cell are compared.
+
+    A point is a crossing when at least min_wires different wires
+    go through it. Self-crossings of a wire are not counted, and the
+    central port is never a crossing.
+    """
+
+    def __init__(self,
+                 wires: List[List[str]],
+                 central_port: tuple = (0, 0),
+                 cell_size: int = None
+                 ):
+
+        self.central_port = central_port
+        self.segments = [get_wire_segments(w, central_port) for w in wires]
+        self.n_wires = len(wires)
+
+        # Default cell size: median segment length
+        if cell_size is None:
+            lengths = sorted(abs(s[2]-s[0]) + abs(s[3]-s[1])
+                             for wire in self.segments for s in wire)
+            cell_size = lengths[len(lengths)//2] if lengths else 1
+        self.cell_size = max(1, cell_size)
+
+        # Fill the buckets
+        self._buckets = {}
+        for wire_id, wire in enumerate(self.segments):
+            for seg_id, seg in enumerate(wire):
+                for cell in self._segment_cells(seg):
+                    self._buckets.setdefault(cell, []).append(
+                        (wire_id, seg_id))
+
+        self._points = self._find_crossings()
+        self._table = self._crossings_table()
+
+    def _cell(self, point: tuple) -> tuple:
+        return (point[0] // self.cell_size, point[1] // self.cell_size)
+
+    def _segment_cells(self, seg: tuple) -> List[tuple]:
+        start = self._cell((min(seg[0], seg[2]), min(seg[1], seg[3])))
+        end = self._cell((max(seg[0], seg[2]), max(seg[1], seg[3])))
+        return [(cx, cy)
+                for cx in range(start[0], end[0]+1)
+                for cy in range(start[1], end[1]+1)]
+
+    def _find_crossings(self) -> dict:
+        """
+        Computes, for every point visited by more than one wire, the
+        minimum number of steps each wire needs to reach it.
+        """
+
+        points = {}
+        size = self.cell_size
+        for cell, entries in self._buckets.items():
+            # Each point is only handled in its own cell
+            bounds = (cell[0]*size, cell[1]*size,
+                      (cell[0]+1)*size - 1, (cell[1]+1)*size - 1)
+
+            for i in range(len(entries)):
+                wire1, seg_id1 = entries[i]
+                seg1 = self.segments[wire1][seg_id1]
+
+                for wire2, seg_id2 in entries[i+1:]:
+                    if wire1 == wire2:
+                        continue
+                    seg2 = self.segments[wire2][seg_id2]
+
+                    for p in _segment_intersection(seg1, seg2, bounds):
+                        if p == self.central_port:
+                            continue
+
+                        visits = points.setdefault(p, {})
+                        for wire, seg in [(wire1, seg1), (wire2, seg2)]:
+                            steps = seg[4] + abs(p[0]-seg[0]) + abs(p[1]-seg[1])
+                            if wire not in visits or steps < visits[wire]:
+                                visits[wire] = steps
+        return points
+
+    def _crossings_table(self) -> tuple:
+        """
+        Builds the table of all the points visited by more than one
+        wire, along with the number of wires visiting each of them
+        """
+
+        points = list(self._points.keys())
+        visits = list(self._points.values())
+        x = np.array([p[0] for p in points], dtype='int64')
+        y = np.array([p[1] for p in points], dtype='int64')
+
+        table = pd.DataFrame({
+            'x': x,
+            'y': y,
+            'wires': [tuple(sorted(v.keys())) for v in visits],
+            'distance': (np.abs(x - self.central_port[0]) +
+                         np.abs(y - self.central_port[1])),
+            'combined_steps': np.array([sum(v.values()) for v in visits],
+                                       dtype='int64')
+        })
+        n_wires = np.array([len(v) for v in visits], dtype='int64')
+        return table, n_wires
+
+    def crossings(self, min_wires: int = None) -> pd.DataFrame:
+        """
+        Returns a dataframe with one row per crossing point and columns:
+        - x, y: position of the crossing
+        - wires: tuple with the ids of the wires crossing there
+        - distance: Manhattan distance to the central port
+        - combined_steps: sum of the steps of those wires to the point
+        By default, only points where all the wires cross are returned.
+        """
+
+        if min_wires is None:
+            min_wires = self.n_wires
+
+        table, n_wires = self._table
+        return table[n_wires >= min_wires].reset_index(drop=True)
+
+    def _minimum(self, column: str, min_wires: int = None) -> dict:
+        df = self.crossings(min_wires)
+        if len(df) == 0:
+            raise ValueError('The wires do not cross!')
+
+        idx = df[column].idxmin()
+        knot = (int(df.loc[idx, 'x']), int(df.loc[idx, 'y']))
+        return {'position': knot, 'distance': int(df.loc[idx, column])}
+
+    def get_minimum_Manhattan(self, min_wires: int = None) -> dict:
+        """
+        Returns a dictionary with the position of the closest crossing to
+        the central port and its Manhattan distance.
+        """
+        return self._minimum('distance', min_wires)
+
+    def get_minimum_combined_steps(self, min_wires: int = None) -> dict:
+        """
+        Returns a dictionary with the position of the crossing with the
+        minimum sum of combined steps, and that sum.
+        """
+        return self._minimum('combined_steps', min_wires)
+
+    def turn_points(self) -> dict:
+        """
+        Returns a dictionary with a dataframe of turning points per
+        wire, with columns x and y (for visualization)
+        """
+        res = {}
+        for i, wire in enumerate(self.segments):
+            x = [self.central_port[0]] + [s[2] for s in wire]
+            y = [self.central_port[1]] + [s[3] for s in wire]
+            res['Wire '+str(i+1)] = pd.DataFrame({'x': x, 'y': y})
+        return res
@@ -1,17 +1,128 @@
 from typing import List
+from array import array
+import hashlib
 import os
+import numpy as np
 from src.graph import Graph
+from src import traversal
+
+
+def _parse_orbits(lines, ids: dict, labels: List[str],
+                  sources: array, targets: array):
+    """ Adds the orbits in the lines (bytes) to the parallel arrays
+    of source and target ids, interning the object names """
+    for line in lines:
+        line = line.strip()
+        if len(line) == 0:
+            continue
+        center, obj = line.split(b')')
+        for name, ids_array in [(center, sources), (obj, targets)]:
+            i = ids.get(name)
+            if i is None:
+                i = ids[name] = len(labels)
+                labels.append(name.decode())
+            ids_array.append(i)
+
+
+def read_orbits(path: str, chunk_size: int = 1 << 20) -> tuple:
+    """
+    Streams an orbits file in chunks of chunk_size bytes.
+
+    Return:
+    A tuple with the list of object names and the arrays with the
+    ids of the center and the object of each orbit
+    """
+    ids, labels = {}, []
+    sources, targets = array('q'), array('q')
+
+    rest = b''
+    with open(path, 'rb') as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                break
+            lines = (rest + chunk).split(b'\n')
+            rest = lines.pop()
+            _parse_orbits(lines, ids, labels, sources, targets)
+    _parse_orbits([rest], ids, labels, sources, targets)
+
+    return labels, np.frombuffer(sources, dtype='int64'), \
+        np.frombuffer(targets, dtype='int64')
+
+
+def load_orbits(path: str,
+                directed: bool = True,
+                cache_dir: str = None
+                ) -> Graph:
+    """
+    Loads an orbits file into a frozen graph, built in bulk.
+
+    With a cache_dir, the parsed graph is stored there in a binary
+    .npz file. It is reused while the file modification time is the
+    same or, if it changed, while the content hash is the same.
+    """
+
+    if cache_dir is None:
+        labels, sources, targets = read_orbits(path)
+        return Graph.from_edges(labels, sources, targets, directed)
+
+    # The hash of the absolute path tells apart files with the same name
+    path_key = hashlib.sha256(
+        os.path.abspath(path).encode()).hexdigest()[:16]
+    name = '{}.{}.{}.npz'.format(os.path.basename(path), path_key,
+                                 'directed' if directed else 'undirected')
+    cache_path = os.path.join(cache_dir, name)
+    mtime = os.path.getmtime(path)
+    digest = None
+
+    if os.path.exists(cache_path):
+        with np.load(cache_path) as cached:
+            valid = cached['mtime'] == mtime
+            if not valid:
+                digest = _file_hash(path)
+                valid = str(cached['hash']) == digest
+            if valid:
+                g = Graph.from_csr(cached['labels'].tolist(),
+                                   cached['offsets'], cached['neighbors'],
+                                   directed)
+        if valid:
+            if digest is not None:
+                # Same content with a new mtime: store it to skip the
+                # hash next time
+                _save_cache(cache_path, g, mtime, digest)
+            return g
+
+    labels, sources, targets = read_orbits(path)
+    g = Graph.from_edges(labels, sources, targets, directed)
+
+    os.makedirs(cache_dir, exist_ok=True)
+    _save_cache(cache_path, g, mtime, digest or _file_hash(path))
+    return g
+
+
+def _save_cache(cache_path: str, g: Graph, mtime: float, digest: str):
+    np.savez(cache_path, labels=np.array(g.get_nodes()), offsets=g.offsets,
+             neighbors=g.neighbors, mtime=mtime, hash=digest)
+
+
+def _file_hash(path: str) -> str:
+    with open(path, 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()
 
 
 def create_graph(orbits_path: str = None,
                  orbits: List[str] = None,
                  root_path: str = 'data/raw',
-                 directed: bool = True
+                 directed: bool = True,
+                 cache_dir: str = None
                  ) -> Graph:
     """
     Creates an orbits graph. The orbit information can be provided as 
     a list of strings, like ['A)B', 'B)C'] or as the path of a file
-    containing one orbit per line
+    containing one orbit per line. The graph is built in bulk, so it
+    is returned frozen.
+    With a cache_dir (e.g. 'data/interim'), the graph parsed from a
+    file is cached in binary format.
     """
 
     if orbits_path is not None:
@@ -24,50 +135,123 @@ def create_graph(orbits_path: str = None,
         if orbits is not None:
             raise ValueError('WARNING: Using orbits from file')
 
-        # Read and format the orbits file
-        f = open(path, 'r')
-        orbits = f.readlines()
-        orbits = [o.replace('\n', '') for o in orbits]
+        return load_orbits(path, directed=directed, cache_dir=cache_dir)
 
     elif orbits is None:
         raise ValueError('Provide some orbits')
 
     # Create the graph
-    g = Graph(directed=directed)
-    for orbit in orbits:
-        objects = orbit.split(')')
-        g.add_edge(objects[0], objects[1])
+    ids, labels = {}, []
+    sources, targets = array('q'), array('q')
+    _parse_orbits([o.encode() for o in orbits], ids, labels,
+                  sources, targets)
+    return Graph.from_edges(labels, sources, targets, directed)
 
-    return g
+
+def orbit_depths(g: Graph, center: str = 'COM') -> dict:
+    """
+    Computes the depth of every object in the orbit tree (number of
+    direct and indirect orbits) with a single BFS from the center.
+    """
+    return traversal.bfs_distances(g, center)
 
 
 def count_orbits(g: Graph, center: str = 'COM') -> int:
     """
-    Counts the total number of direct and indirect orbits in the graph.
+    Counts the total number of direct and indirect orbits in the graph:
+    the sum of the depths of all the objects, computed in one pass.
+    """
+    return sum(orbit_depths(g, center).values())
+
 
-    Note:  This implementation is quite inefficient, since it uses DFS 
-    starting always with "COM". Then, the same path is computed a lot 
-    of different times for big graphs. It could be optimized moving also
-    the starting point.
+class OrbitIndex(object):
     """
-    objs = g.get_nodes()
-    objs.remove(center)
+    Lowest common ancestor index over the orbit tree, to answer
+    transfer queries in O(1). It stores an Euler tour of the tree
+    (objects in DFS visiting order, repeated when coming back) with
+    their depths, and a sparse table with the position of the minimum
+    depth of every power-of-2 window of the tour.
+    """
+
+    def __init__(self, g: Graph, center: str = 'COM'):
+
+        # Iterative Euler tour from the center
+        self.objects = [center]
+        self.first = {center: 0}
+        tour, depths = [0], [0]
+        stack = [(0, None, iter(g.get_neighbors(center)))]
+
+        while stack:
+            obj, parent, neighbors = stack[-1]
+            child = next(neighbors, None)
+            while child is not None and (child == parent or
+                                         child in self.first):
+                child = next(neighbors, None)
+
+            if child is None:
+                # Back to the parent
+                stack.pop()
+                if stack:
+                    tour.append(stack[-1][0])
+                    depths.append(len(stack) - 1)
+            else:
+                self.first[child] = len(tour)
+                self.objects.append(child)
+                tour.append(len(self.objects) - 1)
+                depths.append(len(stack))
+                stack.append((len(self.objects) - 1, self.objects[obj],
+                              iter(g.get_neighbors(child))))
+
+        self._tour = np.array(tour, dtype='int64')
+        self._depths = np.array(depths, dtype='int64')
+
+        # Sparse table: position of the minimum depth in each window
+        table = [np.arange(len(tour))]
+        width = 1
+        while 2 * width <= len(tour):
+            prev = table[-1]
+            left, right = prev[:-width], prev[width:]
+            table.append(np.where(self._depths[left] <= self._depths[right],
+                                  left, right))
+            width *= 2
+        self._table = table
+
+    def _position(self, obj: str) -> int:
+        if obj not in self.first:
+            raise ValueError('Object {} not in the orbit tree.'.format(obj))
+        return self.first[obj]
+
+    def depth(self, obj: str) -> int:
+        """ Number of direct and indirect orbits of the object """
+        return int(self._depths[self._position(obj)])
+
+    def common_center(self, object1: str, object2: str) -> str:
+        """ Closest object orbited (directly or not) by both objects """
+        i, j = sorted([self._position(object1), self._position(object2)])
+        k = (j - i + 1).bit_length() - 1
+        a, b = self._table[k][i], self._table[k][j - (1 << k) + 1]
+        best = a if self._depths[a] <= self._depths[b] else b
+        return self.objects[self._tour[best]]
 
-    n = 0
-    for obj in objs:
-        n = n + len(g.find_path_DFS(center, obj)) - 1
-    return n
+    def count_transfers(self, object1: str, object2: str) -> int:
+        """
+        Number of orbit transfers needed for object1 to orbit the
+        same object as object2.
+        """
+        center = self.common_center(object1, object2)
+        return (self.depth(object1) + self.depth(object2) -
+                2 * self.depth(center) - 2)
 
 
 def count_transfers(g: Graph,
                     object1: str = 'SAN',
-                    object2: str = 'YOU'
+                    object2: str = 'YOU',
+                    center: str = 'COM'
                     ) -> int:
     """
     Counts the number of orbit transfers needed for object1 to
     orbit the same object as object2.
+    For many queries, build an OrbitIndex once and use its
+    count_transfers method.
     """
-    path = g.find_path_DFS(object1, object2)
-    if path is None:
-        raise ValueError('Path between objects can not be found.')
-    return(len(path)-3)
+    return OrbitIndex(g, center).count_transfers(object1, object2)
@@ -3,80 +3,78 @@ import numpy as np
 import pandas as pd
 import os
 
-def highest_amplification_signal(digits_path: str,
-                                 n_rows: int,
-                                 n_cols: int,
-                                 root_path: str = 'data/raw'
-                                 ) -> List[np.ndarray]:
+def read_image_layers(digits_path: str,
+                      n_rows: int,
+                      n_cols: int,
+                      root_path: str = 'data/raw'
+                      ) -> np.ndarray:
     """
     From a file containing the digits of an image, it returns
-    a list with the different layers. Each layer is represented
-    as a numpy array. 
+    an array with the different layers, with shape
+    (layers, n_rows, n_cols). The file is memory-mapped and its
+    bytes converted to digits in a single array operation.
     """
 
-    # Read the image file
+    # Memory-map the image file
     path = os.path.join(root_path, digits_path)
-    f = open(path, 'r')
-    digits = f.read()
-    digits = digits.replace('\n', '')
-    digits = list(map(int, list(digits)))
+    if not os.path.exists(path):
+        raise ValueError('Image not available at {}'.format(path))
+    if os.path.getsize(path) == 0:
+        raise ValueError('Empty image at {}'.format(path))
+    raw = np.memmap(path, dtype='uint8', mode='r')
+
+    # Digits without the trailing line breaks
+    is_digit = (raw >= ord('0')) & (raw <= ord('9'))
+    end = len(raw)
+    while end > 0 and not is_digit[end-1]:
+        end -= 1
+    if is_digit[:end].all():
+        digits = raw[:end] - ord('0')
+    else:
+        digits = raw[is_digit] - ord('0')
 
-    # Split the digits into layers
     n = n_rows * n_cols
-    layers = [digits[i:i + n] for i in range(0, len(digits), n)]
+    if len(digits) % n != 0:
+        raise ValueError('The digits do not fit in layers of {}x{}'.format(
+            n_rows, n_cols))
+
+    # Split the digits into layers
+    return digits.reshape(-1, n_rows, n_cols)
 
-    # Reshape the images
-    layers = [np.asarray(img) for img in layers]
-    layers = [img.reshape(n_rows, n_cols) for img in layers]
 
-    return layers
+# Name kept for compatibility
+highest_amplification_signal = read_image_layers
 
 
-def check_corrupted_image(img: List[np.ndarray]) -> int:
+def check_corrupted_image(img: np.ndarray) -> int:
     """
     Returns the number to decide whether the image is corrupted:
     number of 1 digits multiplied by the number of 2 digits for
     the layer that contains the fewest 0 digits.
     """
-    min_count = None
-    min_zeros = np.infty
+    img = np.asarray(img)
 
-    # Loop over the layers of the image
-    for layer in img:
-        unique, counts = np.unique(layer, return_counts=True)
-        digit_count = dict(zip(unique, counts))
-        
-        # Check if it is the minimm
-        if 0 in digit_count.keys() and digit_count[0] < min_zeros:
-            min_zeros = digit_count[0]
-            min_count = digit_count
+    # Layer with the fewest zeros
+    zeros = np.count_nonzero(img == 0, axis=(1, 2))
+    layer = img[np.argmin(zeros)]
 
-    # Check the selecte layer
-    if 1 not in min_count.keys() or 2 not in min_count.keys():
+    # Check the selected layer
+    ones = np.count_nonzero(layer == 1)
+    twos = np.count_nonzero(layer == 2)
+    if ones == 0 or twos == 0:
         raise ValueError('Corrupted image!')
 
     # Return the check number
-    return min_count[1] * min_count[2]
+    return ones * twos
 
-def decode_image(img: List[np.ndarray]) -> np.ndarray:
+def decode_image(img: np.ndarray) -> np.ndarray:
     """
     Decode a layered image: 0 is black, 1 is white, and 2 is transparent.
+    Each pixel takes the value of the first non transparent layer.
     """
-    img_shape = img[0].shape
-    decoded = np.ones(img_shape) * (-1)
-
-    # Loop over the pixel positions
-    for i in range(img_shape[0]):
-        for j in range(img_shape[1]):
-
-            # Get layer pixels
-            pixels = [int(layer[i][j]) for layer in img]
-
-            # Find final pixel value
-            pixels = [p for p in pixels if p!=2]
-            decoded[i][j] = pixels[0]
-
-    return decoded
+    img = np.asarray(img)
+    first = np.argmax(img != 2, axis=0)
+    return np.take_along_axis(img, first[None, :, :], axis=0)[0]
 
 def image_to_dataframe(img: List[np.ndarray]) -> pd.DataFrame:
     """
@@ -1,48 +1,149 @@
+import numpy as np
+
 
 class Graph:
+    """
+    Graph stored as adjacency lists of integer node ids. The node
+    labels are interned: each new label gets the next id.
+
+    After freeze(), the adjacency is compacted in CSR format: the
+    neighbors of node i are neighbors[offsets[i]:offsets[i+1]], and
+    no more edges can be added.
+    """
 
     def __init__(self, directed: bool = True):
-        self._graph_dict = {}
+        self._ids = {}
+        self._labels = []
+        self._adjacency = []
         self.directed = directed
 
+        # CSR arrays, available once frozen
+        self.offsets = None
+        self.neighbors = None
+
+    @classmethod
+    def from_csr(cls, labels, offsets, neighbors, directed: bool = True):
+        """ Creates a frozen graph from its labels and CSR arrays """
+        g = cls(directed=directed)
+        g._labels = list(labels)
+        g._ids = {label: i for i, label in enumerate(g._labels)}
+        g._adjacency = None
+        g.offsets = np.asarray(offsets, dtype='int64')
+        g.neighbors = np.asarray(neighbors, dtype='int64')
+        return g
+
+    @classmethod
+    def from_edges(cls, labels, sources, targets, directed: bool = True):
+        """
+        Creates a frozen graph in bulk from the node labels and the
+        parallel arrays with the source and target id of each edge
+        """
+        sources = np.asarray(sources, dtype='int64')
+        targets = np.asarray(targets, dtype='int64')
+        if not directed:
+            sources, targets = (np.concatenate([sources, targets]),
+                                np.concatenate([targets, sources]))
+
+        # Group the edges by source, keeping their order
+        order = np.argsort(sources, kind='stable')
+        offsets = np.zeros(len(labels) + 1, dtype='int64')
+        np.cumsum(np.bincount(sources, minlength=len(labels)),
+                  out=offsets[1:])
+        return cls.from_csr(labels, offsets, targets[order], directed)
+
+    @property
+    def frozen(self) -> bool:
+        return self.offsets is not None
+
+    def _intern(self, node) -> int:
+        if node not in self._ids:
+            self._ids[node] = len(self._labels)
+            self._labels.append(node)
+            self._adjacency.append([])
+        return self._ids[node]
+
     def add_edge(self, node, neighbor):
-        if node not in self._graph_dict:
-            self._graph_dict[node] = [neighbor]
-        else:
-            self._graph_dict[node].append(neighbor)
-        
-        if neighbor not in self._graph_dict:
-            self._graph_dict[neighbor] = []
+        if self.frozen:
+            raise ValueError('Edges can not be added to a frozen graph!')
+
+        i = self._intern(node)
+        j = self._intern(neighbor)
+        self._adjacency[i].append(j)
 
         # Add edge back for non-directed graphs
         if not self.directed:
-            self._graph_dict[neighbor].append(node)
+            self._adjacency[j].append(i)
+
+    def freeze(self):
+        """ Compacts the adjacency lists into the CSR arrays """
+        if self.frozen:
+            return self
+        degrees = [len(ngs) for ngs in self._adjacency]
+        self.offsets = np.zeros(len(degrees) + 1, dtype='int64')
+        np.cumsum(degrees, out=self.offsets[1:])
+        self.neighbors = np.fromiter(
+            (j for ngs in self._adjacency for j in ngs),
+            dtype='int64', count=int(self.offsets[-1]))
+        self._adjacency = None
+        return self
+
+    def node_id(self, node) -> int:
+        if node not in self._ids:
+            raise ValueError('Node not available in the graph!')
+        return self._ids[node]
+
+    def node_label(self, node_id: int):
+        return self._labels[node_id]
+
+    def n_nodes(self) -> int:
+        return len(self._labels)
+
+    def neighbor_ids(self, node_id: int):
+        """ Neighbor ids of a node id, without copying them """
+        if self.frozen:
+            return self.neighbors[self.offsets[node_id]:
+                                  self.offsets[node_id+1]]
+        return self._adjacency[node_id]
 
     def get_nodes(self):
-        return list(self._graph_dict.keys())
+        return list(self._labels)
 
     def get_neighbors(self, node):
-        if node not in self.get_nodes():
-            raise ValueError('Node not available in the graph!')
-        return self._graph_dict[node]
+        labels = self._labels
+        return [labels[j] for j in self.neighbor_ids(self.node_id(node))]
 
     def print_edges(self):
-        for node in self._graph_dict:
-            for neighbor in self._graph_dict[node]:
-                print('(', node, ', ', neighbor, ')')
+        for i, node in enumerate(self._labels):
+            for j in self.neighbor_ids(i):
+                print('(', node, ', ', self._labels[j], ')')
 
     def count_edges(self):
-        return sum([len(ngs) for ngs in self._graph_dict.values()])
+        if self.frozen:
+            return len(self.neighbors)
+        return sum([len(ngs) for ngs in self._adjacency])
 
     def find_path_DFS(self, start, end):
-        if start not in self.get_nodes() or end not in self.get_nodes():
-            raise ValueError('Node not available in the graph!')
+        start_id = self.node_id(start)
+        end_id = self.node_id(end)
+
+        # Visited bitmap and parent pointers instead of path copies
+        visited = np.zeros(self.n_nodes(), dtype=bool)
+        parent = np.full(self.n_nodes(), -1, dtype='int64')
+        visited[start_id] = True
 
-        stack = [(start, [start])]
+        stack = [start_id]
         while stack:
-            (node, path) = stack.pop()
-            for next in set(self.get_neighbors(node)) - set(path):
-                if next == end:
-                    return path + [next]
-                else:
-                    stack.append((next, path + [next]))
+            node = stack.pop()
+            for next in self.neighbor_ids(node):
+                if visited[next]:
+                    continue
+                visited[next] = True
+                parent[next] = node
+                if next == end_id:
+                    # Rebuild the path from the end
+                    path = []
+                    while next != -1:
+                        path.append(self._labels[next])
+                        next = parent[next]
+                    return path[::-1]
+                stack.append(next)
@@ -0,0 +1,117 @@
+from typing import Iterator, List
+import numpy as np
+from src.graph import Graph
+
+
+def bfs_levels(g: Graph, source) -> Iterator[List]:
+    """
+    Generates the nodes reachable from the source in level order:
+    a list with the nodes at each distance, starting with [source].
+    """
+    visited = np.zeros(g.n_nodes(), dtype=bool)
+    start = g.node_id(source)
+    visited[start] = True
+
+    level = [start]
+    while level:
+        yield [g.node_label(i) for i in level]
+        next_level = []
+        for node in level:
+            for neighbor in g.neighbor_ids(node):
+                if not visited[neighbor]:
+                    visited[neighbor] = True
+                    next_level.append(neighbor)
+        level = next_level
+
+
+def bfs_tree(g: Graph, source) -> tuple:
+    """
+    Single-source BFS over the node ids.
+
+    Return:
+    A tuple of arrays indexed by node id:
+    - distances: number of edges from the source (-1 if unreachable)
+    - parents: previous node id in a shortest path (-1 for the source
+      and the unreachable nodes)
+    """
+    n = g.n_nodes()
+    distances = np.full(n, -1, dtype='int64')
+    parents = np.full(n, -1, dtype='int64')
+
+    start = g.node_id(source)
+    distances[start] = 0
+    queue = [start]
+    head = 0
+    while head < len(queue):
+        node = queue[head]
+        head += 1
+        for neighbor in g.neighbor_ids(node):
+            if distances[neighbor] < 0:
+                distances[neighbor] = distances[node] + 1
+                parents[neighbor] = node
+                queue.append(neighbor)
+
+    return distances, parents
+
+
+def bfs_distances(g: Graph, source) -> dict:
+    """
+    Returns a dictionary with the distance from the source to every
+    reachable node.
+    """
+    distances, _ = bfs_tree(g, source)
+    reachable = np.flatnonzero(distances >= 0)
+    return {g.node_label(i): int(distances[i]) for i in reachable}
+
+
+def dfs_tree(g: Graph, source) -> np.ndarray:
+    """
+    Iterative DFS from the source. Returns the array of parent ids
+    (-1 for the source and the unreachable nodes).
+    """
+    visited = np.zeros(g.n_nodes(), dtype=bool)
+    parents = np.full(g.n_nodes(), -1, dtype='int64')
+
+    stack = [g.node_id(source)]
+    while stack:
+        node = stack.pop()
+        if visited[node]:
+            continue
+        visited[node] = True
+        for neighbor in g.neighbor_ids(node):
+            if not visited[neighbor]:
+                parents[neighbor] = node
+                stack.append(neighbor)
+
+    return parents
+
+
+def reconstruct_path(g: Graph,
+                     parents: np.ndarray,
+                     source,
+                     target
+                     ) -> List:
+    """
+    Rebuilds the path from the source to the target following the
+    parent pointers. Returns None if the target is not reachable.
+    """
+    start = g.node_id(source)
+    node = g.node_id(target)
+
+    path = [node]
+    while node != start:
+        node = parents[node]
+        if node < 0:
+            return None
+        path.append(node)
+
+    return [g.node_label(i) for i in reversed(path)]
+
+
+def shortest_path(g: Graph, start, end) -> List:
+    """
+    Shortest path (in number of edges) between two nodes, or None if
+    there is no path.
+    """
+    _, parents = bfs_tree(g, start)
+    return reconstruct_path(g, parents, start, end)
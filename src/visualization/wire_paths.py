@@ -1,22 +1,174 @@
+import numpy as np
 import plotly.graph_objects as go
 
+# Above this number of plotted points, WebGL traces are used by default
+WEBGL_POINTS = 10000
+
+
+def _fixed_vertices(x: np.ndarray,
+                    y: np.ndarray,
+                    points: list
+                    ) -> np.ndarray:
+    """
+    Boolean mask with the vertices to keep so that the given points
+    stay exactly on the path: the vertex at the point or, if the point
+    is inside a segment, the two ends of that segment.
+    """
+
+    keep = np.zeros(len(x), dtype=bool)
+    for px, py in dict.fromkeys(map(tuple, points)):
+        at_vertex = (x == px) & (y == py)
+        if at_vertex.any():
+            keep |= at_vertex
+            continue
+
+        # Segments containing the point
+        inside = np.flatnonzero((np.minimum(x[:-1], x[1:]) <= px) &
+                                (np.maximum(x[:-1], x[1:]) >= px) &
+                                (np.minimum(y[:-1], y[1:]) <= py) &
+                                (np.maximum(y[:-1], y[1:]) >= py))
+        keep[inside] = True
+        keep[inside+1] = True
+
+    return keep
+
+
+def _vertex_importance(x: np.ndarray,
+                       y: np.ndarray,
+                       keep: np.ndarray
+                       ) -> np.ndarray:
+    """
+    Ramer-Douglas-Peucker importance of each vertex: the tolerance
+    below which the vertex is kept. The ends of the path and the
+    vertices in keep are always kept.
+    """
+
+    n = len(x)
+    importance = np.zeros(n)
+    fixed = np.flatnonzero(keep)
+    fixed = np.unique(np.r_[0, fixed, n-1])
+    importance[fixed] = np.inf
+
+    stack = [(s, e, np.inf) for s, e in zip(fixed[:-1], fixed[1:])]
+    while stack:
+        s, e, parent = stack.pop()
+        if e - s < 2:
+            continue
+
+        # Distances to the line between the ends of the span
+        dx, dy = x[e] - x[s], y[e] - y[s]
+        px, py = x[s+1:e] - x[s], y[s+1:e] - y[s]
+        norm = np.hypot(dx, dy)
+        if norm == 0:
+            dist = np.hypot(px, py)
+        else:
+            dist = np.abs(px*dy - py*dx) / norm
+
+        k = int(np.argmax(dist))
+        d = min(dist[k], parent)
+        importance[s+1+k] = d
+        stack.append((s, s+1+k, d))
+        stack.append((s+1+k, e, d))
+
+    return importance
+
+
+def simplify_path(x,
+                  y,
+                  tolerance: float = None,
+                  max_points: int = None,
+                  keep_points: list = None
+                  ) -> tuple:
+    """
+    Simplifies a path with the Ramer-Douglas-Peucker algorithm.
+    Vertices closer than tolerance to the simplified path are removed,
+    and at most max_points vertices are kept (most important first).
+    The ends of the path and the keep_points (e.g. the crossings) are
+    kept exactly, fixing the ends of the segments that contain them.
+
+    Return:
+    A tuple with the x and y arrays of the simplified path
+    """
+
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    keep = _fixed_vertices(x, y, keep_points or [])
+
+    if len(x) < 3 or (tolerance is None and max_points is None):
+        return x, y
+
+    importance = _vertex_importance(x, y, keep)
+    selected = np.ones(len(x), dtype=bool)
+    if tolerance is not None:
+        selected &= importance >= tolerance
+    if max_points is not None and selected.sum() > max_points:
+        # The fixed points are kept even above the budget
+        budget = max(max_points, np.isinf(importance).sum())
+        candidates = np.flatnonzero(selected)
+        order = np.argsort(-importance[candidates], kind='stable')
+        selected[:] = False
+        selected[candidates[order[:budget]]] = True
+
+    return x[selected], y[selected]
+
 
 def plotly_interactive_paths(turn_points: dict,
                              central_port: tuple,
                              knot: tuple = None,
                              title: str = 'Wire paths',
-                             central_port_size: int = 10
+                             central_port_size: int = 10,
+                             tolerance: float = None,
+                             max_points: int = None,
+                             width_px: int = None,
+                             keep_points: list = None,
+                             webgl: bool = None
                              ):
-    fig = go.Figure()
+    """
+    Plots the wire paths given by their turning points.
 
-    # Plot the wire paths
+    The paths can be simplified to reduce the size of the figure:
+    - tolerance: maximum deviation in data units
+    - width_px: derives the tolerance from the plot width, so that
+      the deviation is below one pixel at the full view
+    - max_points: budget of points per wire
+    The central port, the knot and the keep_points are kept exact.
+    WebGL traces are used when webgl is True or, by default, when
+    there are more than WEBGL_POINTS points to plot.
+    """
+
+    # Points to keep exact in the paths
+    keep = [tuple(central_port)] + list(keep_points or [])
+    if knot is not None:
+        keep.append(tuple(knot))
+
+    # Tolerance of one pixel of the complete plot
+    if tolerance is None and width_px is not None:
+        extent = max(max(p['x'].max() - p['x'].min(),
+                         p['y'].max() - p['y'].min())
+                     for p in turn_points.values())
+        tolerance = extent / width_px
+
+    paths = {}
     for wire_id in turn_points.keys():
         path = turn_points[wire_id]
+        paths[wire_id] = simplify_path(path['x'], path['y'],
+                                       tolerance=tolerance,
+                                       max_points=max_points,
+                                       keep_points=keep)
+
+    if webgl is None:
+        webgl = sum(len(p[0]) for p in paths.values()) > WEBGL_POINTS
+    scatter = go.Scattergl if webgl else go.Scatter
+
+    fig = go.Figure()
+
+    # Plot the wire paths
+    for wire_id, (x, y) in paths.items():
 
         fig.add_trace(
-            go.Scatter(
-                x=path['x'],
-                y=path['y'],
+            scatter(
+                x=x,
+                y=y,
                 name=wire_id,))
 
         fig.update_layout(
@@ -27,10 +179,10 @@ def plotly_interactive_paths(turn_points: dict,
 
     # Add the central port
     fig.add_trace(
-        go.Scatter(
+        scatter(
             mode='markers',
             x=[central_port[0]],
-            y=[central_port[0]],
+            y=[central_port[1]],
             marker=dict(size=central_port_size),
             showlegend=False
         )
@@ -39,7 +191,7 @@ def plotly_interactive_paths(turn_points: dict,
     # Add extra point if required
     if knot is not None:
         fig.add_trace(
-            go.Scatter(
+            scatter(
                 mode='markers',
                 x=[knot[0]],
                 y=[knot[1]],